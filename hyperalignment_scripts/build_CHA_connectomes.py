@@ -4,7 +4,7 @@
 # This script is run on the aligned timeseries data produced from run_hyperalignment_simplified.py
 import numpy as np
 import utils as utils
-import os, sys, glob
+import os, sys
 from scipy.stats import zscore
 from scipy.spatial.distance import pdist, cdist, squareform
 from joblib import Parallel, delayed
@@ -246,25 +246,27 @@ def get_available_subjects(aligned_ts_dir, n_parcels):
     Find subjects that have aligned timeseries data available
     """
     subjects = set()
+    full_suffix = '_aligned_dtseries.npy'
+    split_suffix = '_aligned_dtseries_split_0.npy'
     
     # Look through all parcel directories to find subjects
+    # (a single directory listing per parcel covers both file patterns)
     for parcel in range(1, n_parcels + 1):
         parcel_dir = os.path.join(aligned_ts_dir, f'parcel_{parcel:03d}')
-        if os.path.exists(parcel_dir):
-            # Find all aligned timeseries files
-            full_files = glob.glob(os.path.join(parcel_dir, '*_aligned_dtseries.npy'))
-            split_files = glob.glob(os.path.join(parcel_dir, '*_aligned_dtseries_split_0.npy'))
-            
-            # Extract subject IDs
-            for f in full_files:
-                subj_id = os.path.basename(f).replace('_aligned_dtseries.npy', '')
-                subjects.add(subj_id)
-            
-            for f in split_files:
-                subj_id = os.path.basename(f).replace('_aligned_dtseries_split_0.npy', '')
-                subjects.add(subj_id)
+        try:
+            entries = os.scandir(parcel_dir)
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+        with entries:
+            # Extract subject IDs from full and split aligned timeseries files
+            for entry in entries:
+                name = entry.name
+                if name.endswith(full_suffix):
+                    subjects.add(name[:-len(full_suffix)])
+                elif name.endswith(split_suffix):
+                    subjects.add(name[:-len(split_suffix)])
     
-    return sorted(list(subjects))
+    return sorted(subjects)
 
 if __name__ == '__main__':
     import argparse
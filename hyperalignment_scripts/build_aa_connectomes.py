@@ -205,6 +205,12 @@ def build_split_connectomes(subj_id, save_coarse=False):
     append_log(subj_id, 'split', parcels_done, 'ok', '')
     if verbose: print(f'finished split-half connectomes for {subj_id} saved at {base_outdir}')
 
+def build_all_connectomes(subj_id, save_coarse=False):
+    """Build full then split connectomes in one job, so the split build reuses
+    the dtseries utils cached for the full build instead of reading it again."""
+    build_full_connectomes(subj_id, save_coarse=save_coarse)
+    build_split_connectomes(subj_id, save_coarse=save_coarse)
+
 if __name__ == "__main__":
     import argparse
 
@@ -234,13 +240,15 @@ if __name__ == "__main__":
         print(f"Output directory: {base_outdir}")
 
     # Use utils to find subjects (GSR-aware)
-    all_subjects = utils._discover_subject_ids()
+    all_subjects = utils.get_all_discovered()
     
     # Also check ptseries directory for subjects
     subjects_from_ptseries = []
     if os.path.exists(utils.PTSERIES_ROOT):
-        subjects_from_ptseries = [d for d in os.listdir(utils.PTSERIES_ROOT) 
-                                 if d.startswith("sub-") and os.path.isdir(os.path.join(utils.PTSERIES_ROOT, d))]
+        # DirEntry.is_dir() uses the type from the directory listing, so no stat per entry
+        with os.scandir(utils.PTSERIES_ROOT) as entries:
+            subjects_from_ptseries = [e.name for e in entries
+                                      if e.name.startswith("sub-") and e.is_dir()]
     
     # Use intersection of subjects available in both dtseries and ptseries
     subjects2run = list(set(all_subjects).intersection(set(subjects_from_ptseries)))
@@ -249,7 +257,8 @@ if __name__ == "__main__":
     test_subjects_env = os.environ.get('TEST_SUBJECTS_LIST', '')
     if test_subjects_env:
         test_subjects = test_subjects_env.split()
-        subjects2run = [s for s in subjects2run if s in test_subjects]
+        test_subject_set = set(test_subjects)
+        subjects2run = [s for s in subjects2run if s in test_subject_set]
         if verbose:
             print(f"TEST MODE: Filtering to {len(test_subjects)} test subjects")
             print(f"Test subjects: {test_subjects}")
@@ -286,9 +295,11 @@ if __name__ == "__main__":
         print(f"Processing {len(subjects_to_process)} subjects...")
 
     for s in subjects_to_process:
-        if args.mode in ['full', 'both']:
+        if args.mode == 'both':
+            joblist.append(delayed(build_all_connectomes)(s, save_coarse=True))
+        elif args.mode == 'full':
             joblist.append(delayed(build_full_connectomes)(s, save_coarse=True))
-        if args.mode in ['split', 'both']:
+        elif args.mode == 'split':
             joblist.append(delayed(build_split_connectomes)(s, save_coarse=True))
 
     if verbose:
@@ -5,7 +5,7 @@ import pandas as pd
 import utils
 import glob, sys, os
 from joblib import Parallel, delayed
-from scipy.stats import pearsonr
+from scipy.stats import pearsonr, norm
 
 # Try to import mantel if available, otherwise use fallback
 try:
@@ -15,26 +15,59 @@ except ImportError:
     HAS_MANTEL = False
     print("Warning: mantel module not found, using fallback implementation")
 
+# Parse the ISC matrices with pyarrow's multithreaded CSV reader when available
+try:
+    import pyarrow
+    CSV_ENGINE = 'pyarrow'
+except ImportError:
+    CSV_ENGINE = 'c'
+
+# Number of permutations evaluated per vectorized block in the fallback test
+PERMUTATION_BLOCK = 100
+
+# Opt-in (USE_FISHER_Z=1): when the mantel package is not installed, parcels with
+# at least this many subjects use the analytic Fisher z p-value instead of the
+# fallback permutation test. It treats the n(n-1)/2 pairwise entries as
+# independent, so it is anticonservative and off by default.
+USE_FISHER_Z = os.environ.get('USE_FISHER_Z', '0') == '1'
+FISHER_Z_MIN_SUBJECTS = 200
+
 def mantel_test_fallback(vec1, vec2, method='pearson', permutations=1000):
     """
     Fallback mantel test implementation when mantel module is not available
+
+    method='fisher_z' skips the permutations and derives the p-value from the
+    Fisher z-transform of r. It treats the pairwise entries as independent,
+    which they are not, so its p-values are anticonservative; z is then the
+    Fisher z statistic rather than a permutation z.
     """
     # Calculate observed correlation
-    if method == 'pearson':
-        observed_r, _ = pearsonr(vec1, vec2)
-    else:
-        raise ValueError("Only pearson method supported")
+    if method not in ('pearson', 'fisher_z'):
+        raise ValueError("Only pearson and fisher_z methods supported")
+    observed_r, _ = pearsonr(vec1, vec2)
+
+    if method == 'fisher_z':
+        z_score = np.arctanh(observed_r) * np.sqrt(len(vec1) - 3)
+        p_value = 2 * norm.sf(np.abs(z_score))
+        return observed_r, p_value, z_score
 
     # Permutation test
-    permuted_r = []
+    # Permuting vec2 changes neither its mean nor its norm, so every permuted r
+    # is a dot product of the same centered vectors; evaluate them in blocks
+    # rather than calling pearsonr once per permutation.
+    centered1 = vec1 - np.mean(vec1)
+    centered2 = vec2 - np.mean(vec2)
+    denom = np.sqrt(np.dot(centered1, centered1) * np.dot(centered2, centered2))
+
+    permuted_r = np.empty(permutations)
     np.random.seed(42)  # For reproducibility
-    for _ in range(permutations):
-        perm_vec2 = np.random.permutation(vec2)
-        perm_r, _ = pearsonr(vec1, perm_vec2)
-        permuted_r.append(perm_r)
+    for start in range(0, permutations, PERMUTATION_BLOCK):
+        stop = min(start + PERMUTATION_BLOCK, permutations)
+        perms = np.array([np.random.permutation(len(vec2)) for _ in range(start, stop)])
+        permuted_r[start:stop] = centered2[perms] @ centered1
+    permuted_r /= denom
 
     # Calculate p-value (two-tailed)
-    permuted_r = np.array(permuted_r)
     p_value = np.sum(np.abs(permuted_r) >= np.abs(observed_r)) / permutations
 
     # Calculate z-score equivalent
@@ -51,30 +84,35 @@ def get_valid_ISC_subjects(mat1, mat2=None, include_these=None):
     valid_inds = list(np.intersect1d(valid1, valid2))
     valid_subjects = mat1.index[valid_inds]
     if include_these is not None:
+        include_these = set(include_these)
         valid_subjects = [v for v in valid_subjects if v in include_these]
     return valid_subjects
 
 def run_reliability(fn0, fn1):
     try:
-        mat0 = pd.read_csv(fn0, index_col=0)
-        mat1 = pd.read_csv(fn1, index_col=0)
+        mat0 = pd.read_csv(fn0, index_col=0, engine=CSV_ENGINE)
+        mat1 = pd.read_csv(fn1, index_col=0, engine=CSV_ENGINE)
         valid_subs = get_valid_ISC_subjects(mat0, mat1)
 
         if len(valid_subs) < 2:
-            return np.nan, np.nan, np.nan
+            return np.nan, np.nan, np.nan, None
 
         triu = np.triu_indices(len(valid_subs),1)
         vec0 = mat0.loc[valid_subs][valid_subs].values[triu]
         vec1 = mat1.loc[valid_subs][valid_subs].values[triu]
 
+        # The last value names the test that produced p and z
         if HAS_MANTEL:
             r,p,z = mantel.test(vec0, vec1, method='pearson')
-        else:
-            r,p,z = mantel_test_fallback(vec0, vec1, method='pearson')
-        return r, p, z
+            return r, p, z, 'mantel'
+        if USE_FISHER_Z and len(valid_subs) >= FISHER_Z_MIN_SUBJECTS:
+            r,p,z = mantel_test_fallback(vec0, vec1, method='fisher_z')
+            return r, p, z, 'fisher_z'
+        r,p,z = mantel_test_fallback(vec0, vec1, method='pearson')
+        return r, p, z, 'permutation'
     except Exception as e:
         print(f"Error processing {fn0}, {fn1}: {e}")
-        return np.nan, np.nan, np.nan
+        return np.nan, np.nan, np.nan, None
 
 if __name__ == '__main__':
     # Get output directory from config
@@ -83,26 +121,22 @@ if __name__ == '__main__':
     os.makedirs(results_dir, exist_ok=True)
 
     n_jobs = utils.N_JOBS
-    df = pd.DataFrame(columns=['align','scale','parcel','r', 'p', 'z'])
-    align_vals, scale_vals, parcel_vals = [], [], []
-    joblist = []
 
     print(f"Looking for similarity matrices in: {similarity_dir}")
 
     # Build job list for ALL parcels (matching Erica's original)
     # This ensures parcel numbers are always present, even if files are missing (will be NaN)
-    for a in ['aa','cha']:
-        for s in ['coarse','fine']:
-            for p in range(1,361):
-                fn0 = f'{similarity_dir}/{a}_{s}_split0_parcel_{p:03d}_ISC.csv'
-                fn1 = f'{similarity_dir}/{a}_{s}_split1_parcel_{p:03d}_ISC.csv'
-
-                # Always add to job list (like Erica's original)
-                # Missing files will result in NaN which we keep in final output
-                joblist.append(delayed(run_reliability)(fn0, fn1))
-                align_vals.append(a)
-                scale_vals.append(s)
-                parcel_vals.append(p)
+    align_grid, scale_grid, parcel_grid = np.meshgrid(
+        ['aa','cha'], ['coarse','fine'], np.arange(1,361), indexing='ij')
+    align_vals = align_grid.ravel()
+    scale_vals = scale_grid.ravel()
+    parcel_vals = parcel_grid.ravel()
+
+    # Always add to job list (like Erica's original)
+    # Missing files will result in NaN which we keep in final output
+    joblist = [delayed(run_reliability)(f'{similarity_dir}/{a}_{s}_split0_parcel_{p:03d}_ISC.csv',
+                                        f'{similarity_dir}/{a}_{s}_split1_parcel_{p:03d}_ISC.csv')
+               for a, s, p in zip(align_vals, scale_vals, parcel_vals)]
 
     # Sanity check: should have 1440 jobs (2 alignments × 2 scales × 360 parcels)
     if len(joblist) == 0:
@@ -114,14 +148,16 @@ if __name__ == '__main__':
     print(f"Running {len(joblist)} reliability analyses with {n_jobs} jobs...")
 
     with Parallel(n_jobs=n_jobs, verbose=10) as parallel:
-        results = np.array(parallel(joblist))
+        results = parallel(joblist)
+    r_vals, p_vals, z_vals, methods = zip(*results)
 
     df = pd.DataFrame({'align':align_vals,
                       'scale':scale_vals,
                       'parcel':parcel_vals,
-                      'r':results[:,0],
-                      'p':results[:,1],
-                      'z':results[:,2]})
+                      'r':np.array(r_vals, dtype=float),
+                      'p':np.array(p_vals, dtype=float),
+                      'z':np.array(z_vals, dtype=float),
+                      'method':methods})
 
     # Save ALL results including NaN (matching Erica's original)
     output_file = os.path.join(results_dir, 'reliability_results.csv')
@@ -139,6 +175,9 @@ if __name__ == '__main__':
     print(f"  Mean reliability: {df_valid['r'].mean():.4f}")
     print(f"  Range: [{df_valid['r'].min():.4f}, {df_valid['r'].max():.4f}]")
     print(f"  Significant results (p<0.05): {(df_valid['p'] < 0.05).sum()}/{len(df_valid)}")
+    n_fisher = (df_valid['method'] == 'fisher_z').sum()
+    if n_fisher > 0:
+        print(f"  Note: {n_fisher} results use the anticonservative Fisher z p-value (method column)")
 
     # Print detailed breakdown by alignment and scale
     print("\n" + "="*60)
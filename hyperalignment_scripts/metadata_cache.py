@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+"""
+Cached reading of the subject metadata CSV/Excel file.
+
+Parsed tables are stored as parquet in the per-user cache directory that
+read_config uses. Each cache file records the source path, mtime (ns), size
+and requested columns it was built from, and is only reused when all of them
+still match. Cache files not owned by the current user are ignored, so a file
+planted in the cache directory cannot inject subjects or splits.
+
+OPTIONAL DEPENDENCIES:
+- pyarrow: required for the parquet cache; without it the file is parsed on every call
+- python-calamine>=0.2: much faster Excel parsing (falls back to openpyxl)
+"""
+
+import os
+import json
+import hashlib
+
+from read_config import _CACHE_DIR
+
+# Parquet caching of parsed metadata files needs pyarrow; without it the
+# CSV/Excel file is parsed on every call
+try:
+    import pyarrow
+    import pyarrow.parquet as pq
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+# The Rust-backed calamine reader parses large workbooks much faster than
+# openpyxl; pandas picks its default engine when it is not installed
+try:
+    import python_calamine
+    EXCEL_ENGINE = "calamine"
+except ImportError:
+    EXCEL_ENGINE = None
+
+# Schema metadata entry holding the key a cache file was built from
+_KEY_FIELD = b"hbn_cache_key"
+
+
+def read_metadata_cached(path, columns=None):
+    """
+    Read a metadata CSV/Excel file, reusing a parquet copy when it is current.
+
+    Parameters
+    ----------
+    path : str
+        Path to the .csv or Excel file.
+    columns : list of str, optional
+        Columns to read; requested columns missing from the file are skipped
+        rather than raising. If None, all columns are read.
+
+    Returns
+    -------
+    pandas.DataFrame
+        The parsed table.
+    """
+    import pandas as pd
+
+    path = os.path.abspath(path)
+    st = os.stat(path)
+    wanted = sorted(set(columns)) if columns is not None else None
+    key = [path, st.st_mtime_ns, st.st_size, wanted]
+
+    name = hashlib.md5(json.dumps([path, wanted]).encode("utf-8")).hexdigest()[:16]
+    cache = os.path.join(_CACHE_DIR, "metadata_{}.parquet".format(name))
+
+    if HAS_PYARROW:
+        df = _load_cached_table(cache, key)
+        if df is not None:
+            return df
+
+    usecols = None if wanted is None else (lambda col: col in wanted)
+    if path.endswith(".csv"):
+        df = pd.read_csv(path, usecols=usecols)
+    else:
+        df = pd.read_excel(path, usecols=usecols, engine=EXCEL_ENGINE)
+
+    if HAS_PYARROW:
+        _store_cached_table(cache, key, df)
+    return df
+
+
+def _load_cached_table(cache, key):
+    """Return the cached DataFrame if it is ours and was built from the same source."""
+    try:
+        with open(cache, "rb") as f:
+            if hasattr(os, "getuid") and os.fstat(f.fileno()).st_uid != os.getuid():
+                return None
+            table = pq.read_table(f)
+    except OSError:
+        return None
+    except Exception as e:
+        print(f"Warning: Could not read metadata cache {cache}: {e}")
+        return None
+
+    meta = table.schema.metadata or {}
+    try:
+        cached_key = json.loads(meta.get(_KEY_FIELD, b"null"))
+    except ValueError:
+        return None
+    return table.to_pandas() if cached_key == key else None
+
+
+def _store_cached_table(cache, key, df):
+    """Atomically write df with its key to the cache file (best effort)."""
+    tmp = "{}.{}.tmp".format(cache, os.getpid())
+    try:
+        os.makedirs(_CACHE_DIR, mode=0o700, exist_ok=True)
+        table = pyarrow.Table.from_pandas(df)
+        meta = dict(table.schema.metadata or {})
+        meta[_KEY_FIELD] = json.dumps(key).encode("utf-8")
+        pq.write_table(table.replace_schema_metadata(meta), tmp, compression="zstd")
+        os.replace(tmp, cache)
+    except Exception as e:
+        print(f"Warning: Could not write metadata cache {cache}: {e}")
+        if os.path.exists(tmp):
+            os.remove(tmp)
@@ -15,12 +15,26 @@ OPTIONAL EXCEL COLUMNS:
 
 That's it! Do your own stratification/splitting logic outside this script,
 then provide the final subject assignments.
+
+OPTIONAL DEPENDENCIES:
+- python-calamine>=0.2: much faster Excel parsing (falls back to openpyxl)
+- pyarrow: caches the parsed sheet as parquet in the per-user cache directory
 """
 
-import os
 import argparse
-import pandas as pd
 from read_config import METADATA_EXCEL, SUBJECT_ID_COL, SPLIT_COL
+from metadata_cache import read_metadata_cached
+
+
+def load_metadata(path):
+    """
+    Read the metadata Excel file, reusing a cached parquet copy when it is current.
+
+    The cache lives in the per-user cache directory (see metadata_cache) and is
+    keyed by the workbook's path, mtime and size, so restoring an older
+    revision of the workbook is never answered from a stale copy.
+    """
+    return read_metadata_cached(path)
 
 
 def main():
@@ -51,7 +65,7 @@ def main():
 
     # Load Excel
     print(f"[info] Reading Excel: {args.excel}")
-    df = pd.read_excel(args.excel)
+    df = load_metadata(args.excel)
 
     # Check required columns exist
     if args.subject_col not in df.columns:
@@ -67,9 +81,9 @@ def main():
         )
 
     # Normalize subject IDs to sub-XXXXX format
-    df["subject_id"] = df[args.subject_col].astype(str).str.strip()
-    df["subject_id"] = df["subject_id"].apply(
-        lambda x: x if x.startswith("sub-") else f"sub-{x}"
+    subject_ids = df[args.subject_col].astype(str).str.strip()
+    df["subject_id"] = subject_ids.where(
+        subject_ids.str.startswith("sub-"), "sub-" + subject_ids
     )
 
     # Normalize split column values
@@ -84,9 +98,11 @@ def main():
             f"Only 'train' or 'test' allowed (case-insensitive)."
         )
 
-    # Separate into train and test
-    df_train = df[df["split"] == "train"].copy()
-    df_test = df[df["split"] == "test"].copy()
+    # Separate into train and test (only "train"/"test" remain after validation,
+    # so one boolean mask covers both; boolean indexing already returns copies)
+    is_train = (df["split"] == "train").to_numpy()
+    df_train = df[is_train]
+    df_test = df[~is_train]
 
     if len(df_train) == 0:
         raise ValueError("No subjects assigned to 'train' split!")
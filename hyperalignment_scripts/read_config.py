@@ -6,11 +6,40 @@ Reads the centralized config.sh file and makes parameters available as module va
 
 import os
 import re
+import json
+import hashlib
+import functools
+import subprocess
 
+# Parsed config.sh is cached as JSON in a per-user cache directory, keyed by the
+# file's path, mtime and size plus the parser version, so short-lived pipeline
+# scripts and pool workers skip re-parsing an unchanged config. JSON (not
+# pickle) and the owner check keep a planted cache file from running code.
+_CACHE_DIR = os.path.join(
+    os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'),
+    'hbn_asd_adhd')
+# Bump when parsing changes so results of an older parser are not reused
+_CACHE_VERSION = 2
+
+# KEY=value assignments at the start of a line (value is a double-quoted,
+# single-quoted or bare word), and values wrapped in matching quotes
+_ASSIGN_RE = re.compile(r'''^[ \t]*([A-Z_]+)=("(?:[^"\\\n]|\\.)*"|'[^'\n]*'|[^\s#'"]+)''', re.M)
+_QUOTED_RE = re.compile(r'^(["\'])(.*)\1$')
+# bash default expansion ${VAR:-default}; group 1 is the default
+_BASH_DEFAULT_RE = re.compile(r'^\$\{[A-Z_]+:-(.*)\}$')
+
+# Variables bash defines on its own when sourcing config.sh in a clean environment
+_BASH_OWN_VARS = frozenset(['PWD', 'OLDPWD', 'SHLVL', '_'])
+
+@functools.lru_cache(maxsize=None)
 def read_config(config_path=None):
     """
     Read configuration from config.sh file.
 
+    Results are memoized per config_path for the lifetime of the process, so
+    repeated calls (or imports under another module name) do not re-read the
+    file. Treat the returned dict as read-only.
+
     Parameters
     ----------
     config_path : str, optional
@@ -29,55 +58,129 @@ def read_config(config_path=None):
     if not os.path.exists(config_path):
         raise IOError("Config file not found: {}".format(config_path))
 
+    config_path = os.path.abspath(config_path)
+    st = os.stat(config_path)
+    key = [_CACHE_VERSION, config_path, st.st_mtime_ns, st.st_size]
+    cache_file = _cache_file_for(config_path)
+
+    config = _load_cached_config(cache_file, key)
+    if config is None:
+        config = _parse_config_file(config_path)
+        _store_cached_config(cache_file, key, config)
+    return config
+
+def _cache_file_for(config_path):
+    """JSON cache path for a config file; one cache per config path."""
+    digest = hashlib.md5(config_path.encode('utf-8')).hexdigest()[:12]
+    return os.path.join(_CACHE_DIR, 'config_{}.json'.format(digest))
+
+def _load_cached_config(cache_file, key):
+    """
+    Return the cached config dict if it was parsed from the same file version
+    by the same parser. Cache files not owned by the current user are ignored.
+    """
+    try:
+        with open(cache_file, 'r') as f:
+            if hasattr(os, 'getuid') and os.fstat(f.fileno()).st_uid != os.getuid():
+                return None
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(cached, dict) or cached.get('key') != key:
+        return None
+    config = cached.get('config')
+    return config if isinstance(config, dict) else None
+
+def _store_cached_config(cache_file, key, config):
+    """Atomically write the parsed config to the cache file (best effort)."""
+    tmp = '{}.{}.tmp'.format(cache_file, os.getpid())
+    try:
+        os.makedirs(os.path.dirname(cache_file), mode=0o700, exist_ok=True)
+        with open(tmp, 'w') as f:
+            json.dump({'key': key, 'config': config}, f)
+        os.replace(tmp, cache_file)
+    except OSError:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+def _parse_config_file(config_path):
+    """Evaluate config.sh with bash, falling back to the line parser without bash."""
+    config = _source_config_file(config_path)
+    if config is None:
+        config = _parse_config_lines(config_path)
+    return config
+
+def _source_config_file(config_path):
+    """
+    Source config.sh in a clean bash environment and collect the variables it sets.
+
+    The environment is emptied so ${VAR:-default} resolves to the default, exactly
+    like the line parser; environment overrides are applied by _get_config_value.
+    The environment is also dumped before sourcing, separated by an empty entry,
+    so anything a wrapper injects into the child is not mistaken for config.
+    Returns None if bash is unavailable or the file fails to source.
+    """
+    script = 'env -0; printf "\\0"; set -a; source "$1" >/dev/null || exit 1; env -0'
+    try:
+        result = subprocess.run(
+            ['bash', '-c', script, 'bash', config_path],
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, env={}, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+    entries = result.stdout.decode('utf-8', 'replace').split('\0')
+    split = entries.index('')
+    before = set(entries[:split])
+
     config = {}
+    for entry in entries[split + 1:]:
+        key, sep, value = entry.partition('=')
+        if sep and entry not in before and key not in _BASH_OWN_VARS \
+           and re.match(r'^[A-Z_]+$', key):
+            config[key] = _coerce_value(value)
+    return config
+
+def _coerce_value(value):
+    """Convert a config string to int, float or bool where it looks like one."""
+    # Try to convert to int if it looks like a number
+    if value.isdigit():
+        return int(value)
+    # Try to convert to float if it has a decimal point
+    if '.' in value:
+        try:
+            return float(value)
+        except ValueError:
+            return value  # Keep as string
+    # Convert boolean strings
+    if value.lower() in ('true', 'false'):
+        return value.lower() == 'true'
+    return value
 
-    # Read and parse the config file
+def _parse_config_lines(config_path):
+    """Parse KEY=value assignments from config.sh into a dict."""
+    config = {}
+
+    # One pass of the compiled assignment regex over the whole file; comment
+    # lines never match and trailing comments fall outside the value group
     with open(config_path, 'r') as f:
-        for line in f:
-            # Strip whitespace and comments
-            line = line.strip()
-            if not line or line.startswith('#') or line.startswith('#!/'):
-                continue
-
-            # Strip inline comments (everything after # that appears after =)
-            # This handles cases like: KEY="value"  # comment
-            if '#' in line:
-                eq_pos = line.find('=')
-                comment_pos = line.find('#')
-                if eq_pos != -1 and comment_pos > eq_pos:
-                    line = line[:comment_pos].rstrip()
-
-            # Match pattern: KEY=value or KEY="value"
-            match = re.match(r'^([A-Z_]+)=(.+)$', line)
-            if match:
-                key = match.group(1)
-                value = match.group(2).strip()
-
-                # Remove quotes if present
-                if (value.startswith('"') and value.endswith('"')) or \
-                   (value.startswith("'") and value.endswith("'")):
-                    value = value[1:-1]
-
-                # Handle bash variable substitution: ${VAR:-default}
-                # This extracts the default value from bash syntax
-                if value.startswith('${') and ':-' in value and value.endswith('}'):
-                    # Extract default value from ${VAR:-default}
-                    value = value.split(':-')[1].rstrip('}')
-
-                # Try to convert to int if it looks like a number
-                if value.isdigit():
-                    value = int(value)
-                # Try to convert to float if it has a decimal point
-                elif '.' in value:
-                    try:
-                        value = float(value)
-                    except ValueError:
-                        pass  # Keep as string
-                # Convert boolean strings
-                elif value.lower() in ('true', 'false'):
-                    value = value.lower() == 'true'
-
-                config[key] = value
+        content = f.read()
+
+    for match in _ASSIGN_RE.finditer(content):
+        key = match.group(1)
+        value = match.group(2)
+
+        # Remove quotes if present
+        quoted = _QUOTED_RE.match(value)
+        if quoted:
+            value = quoted.group(2)
+
+        # Handle bash variable substitution: ${VAR:-default}
+        # This extracts the default value from bash syntax
+        default = _BASH_DEFAULT_RE.match(value)
+        if default:
+            value = default.group(1)
+
+        config[key] = _coerce_value(value)
 
     return config
 
@@ -37,14 +37,21 @@ if not hasattr(np, 'int'):
     np.int = int
 
 # Consolidated imports (moved to top so all functions can use them)
-import glob
+import re
 import time
 import multiprocessing as mp
-from scipy.stats import zscore
 import contextlib
 from io import StringIO
 import nibabel as nib
 import random
+from concurrent.futures import ThreadPoolExecutor
+
+# Optional JIT kernel for connectome normalization; falls back to numpy
+try:
+    from numba import njit
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
 
 @contextlib.contextmanager
 def suppress_stderr():
@@ -83,10 +90,108 @@ with warnings.catch_warnings():
     warnings.simplefilter("ignore")
     empty_dataset = Dataset(np.empty((1, VERTICES_IN_BOUNDS)))
 
-# Load Glasser atlas (use centralized ATLAS_FILE)
-def load_glasser_atlas():
-    g = nib.load(ATLAS_FILE)
-    return g.get_fdata().T
+# Sample targets shared by every connectome dataset; read-only because all
+# datasets reference the same array
+_TARGETS = np.arange(1, N_PARCELS, dtype=np.int32)
+_TARGETS.setflags(write=False)
+
+# Column-wise zscore that reuses the input buffer; constant columns become 0
+# rather than NaN
+def zscore_inplace(a):
+    if HAS_NUMBA and a.ndim == 2:
+        return _zscore_safe_nb(a)
+    a -= a.mean(axis=0, keepdims=True)
+    std = a.std(axis=0, keepdims=True)
+    std[std == 0] = 1
+    a /= std
+    return a
+
+
+if HAS_NUMBA:
+    # Kernels below are not parallel (the pool already uses every core) and
+    # avoid fastmath, which would let numba assume NaNs never occur.
+
+    # Centers each column of x in place and returns the column std (ddof=0)
+    @njit(cache=True)
+    def _center_cols_nb(x):
+        n, m = x.shape
+        mean = np.zeros(m)
+        for i in range(n):
+            for j in range(m):
+                mean[j] += x[i, j]
+        mean /= n
+        var = np.zeros(m)
+        for i in range(n):
+            for j in range(m):
+                v = x[i, j] - mean[j]
+                x[i, j] = v
+                var[j] += v * v
+        return np.sqrt(var / n)
+
+    # Same result as zscore_inplace followed by nan_to_num, without the
+    # temporaries: columns containing NaN or with zero variance become 0.
+    @njit(cache=True)
+    def _zscore_fill_nb(x):
+        n, m = x.shape
+        sd = _center_cols_nb(x)
+        scale = np.zeros(m)
+        for j in range(m):
+            if sd[j] > 0:
+                scale[j] = 1.0 / sd[j]
+        for i in range(n):
+            for j in range(m):
+                v = x[i, j] * scale[j]
+                x[i, j] = 0.0 if np.isnan(v) else v
+        return x
+
+    # Kernel for zscore_inplace: zero-variance columns are divided by 1, so they
+    # become 0, and NaN columns stay NaN. Run right after the BLAS projection so
+    # the aligned output is normalized in one kernel without temporaries.
+    @njit(cache=True)
+    def _zscore_safe_nb(x):
+        n, m = x.shape
+        sd = _center_cols_nb(x)
+        scale = np.ones(m)
+        for j in range(m):
+            if sd[j] != 0:
+                scale[j] = 1.0 / sd[j]
+        for i in range(n):
+            for j in range(m):
+                x[i, j] = x[i, j] * scale[j]
+        return x
+
+    # In-place equivalent of scipy's zscore(x, axis=0), including NaN for
+    # zero-variance columns (hence the numpy error model for 0/0)
+    @njit(cache=True, error_model='numpy')
+    def _zscore_cols_nb(x):
+        n, m = x.shape
+        sd = _center_cols_nb(x)
+        for i in range(n):
+            for j in range(m):
+                x[i, j] = x[i, j] / sd[j]
+        return x
+
+
+# Column-wise zscore of a float32 array, in place. Matches scipy's
+# zscore(d, axis=0), including NaN for zero-variance columns.
+def zscore_cols(d):
+    d = np.require(d, requirements=['C', 'W'])
+    if HAS_NUMBA:
+        return _zscore_cols_nb(d)
+    d -= d.mean(axis=0, keepdims=True)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        d /= d.std(axis=0, keepdims=True)
+    return d
+
+
+# Reads a connectome .npy into one float32 buffer and normalizes it in place;
+# the file is memory-mapped so only the float32 copy is materialized
+def load_cnx(fn):
+    d = np.array(np.load(fn, mmap_mode='r'), dtype=np.float32)
+    if HAS_NUMBA:
+        return _zscore_fill_nb(d)
+    zscore_inplace(d)
+    return np.nan_to_num(d, copy=False)
 
 
 # Loads in pre-computed connectomes for each subject, each parcel, and formats training hyperalignment.
@@ -96,7 +201,7 @@ def prep_cnx(args):
     if not os.path.exists(fn):
         raise FileNotFoundError("Connectome file not found: {}".format(fn))
     
-    d = np.nan_to_num(zscore(np.load(fn)))
+    d = load_cnx(fn)
     
     # Suppress warnings during Dataset creation
     with warnings.catch_warnings():
@@ -104,8 +209,8 @@ def prep_cnx(args):
         ds_train = Dataset(d)
     
     # Use centralized parcel constant
-    ds_train.sa['targets'] = np.arange(1, N_PARCELS)
-    ds_train.fa['seeds'] = np.where(glasser_atlas == current_parcel)[0]
+    ds_train.sa['targets'] = _TARGETS
+    ds_train.fa['seeds'] = _PARCEL_VERTICES[current_parcel]
     return ds_train
 
 
@@ -116,15 +221,15 @@ def prep_cnx_split(args):
     if not os.path.exists(fn):
         raise FileNotFoundError("Split connectome file not found: {}".format(fn))
 
-    d = np.nan_to_num(zscore(np.load(fn)))
+    d = load_cnx(fn)
 
     # Suppress warnings during Dataset creation
     with warnings.catch_warnings():
         warnings.simplefilter("ignore")
         ds_train = Dataset(d)
 
-    ds_train.sa['targets'] = np.arange(1, N_PARCELS)
-    ds_train.fa['seeds'] = np.where(glasser_atlas == current_parcel)[0]
+    ds_train.sa['targets'] = _TARGETS
+    ds_train.fa['seeds'] = _PARCEL_VERTICES[current_parcel]
     return ds_train
 
 # Simplified dtseries loader: always load GSR dtseries (uses top-level nib)
@@ -132,11 +237,16 @@ def load_dtseries_data(subj_id, parcel=None):
     """Load dtseries data from the GSR dataset (Python 2 version)."""
     dtseries_root = DTSERIES_ROOT
     filename = DTSERIES_FILENAME_TEMPLATE.format(subj=subj_id)
-    ds = nib.load(os.path.join(dtseries_root, filename)).get_fdata()[:, :VERTICES_IN_BOUNDS]
+    dataobj = nib.load(os.path.join(dtseries_root, filename)).dataobj
     if parcel:
-        mask = (glasser_atlas == parcel).squeeze()
-        return zscore(ds[:, mask], axis=0)
-    return zscore(ds, axis=0)
+        # Read only the contiguous span of columns covering the parcel (the proxy
+        # does not support fancy indexing reliably), then pick its vertices
+        cols = _PARCEL_VERTICES[parcel]
+        lo, hi = cols[0], cols[-1] + 1
+        span = np.asarray(dataobj[:, lo:hi], dtype=np.float32)
+        return zscore_cols(span[:, cols - lo])
+    ds = np.asarray(dataobj[:, :VERTICES_IN_BOUNDS], dtype=np.float32)
+    return zscore_cols(ds)
 
 # Helper to centralize output directory construction
 def setup_output_dirs(base_connectome_dir, parcel):
@@ -150,42 +260,92 @@ def setup_output_dirs(base_connectome_dir, parcel):
 def prep_dtseries(args):
     subject, current_parcel, split = args
     d = load_dtseries_data(subject, parcel=current_parcel)
+    return select_split(d, split)
 
+# Takes the requested half of an already loaded timeseries and re-normalizes it.
+# load_dtseries_data output is already z-scored, so the full series is returned
+# as is; only a half needs normalizing again (in place, the halves don't overlap)
+def select_split(d, split):
     if split is not None:  # Choose if this is either the first or the second half of the dataset
         half = d.shape[0] // 2
         start = split * half
-        tpts_in_bounds = np.arange(start, start + half)
-        d = d[tpts_in_bounds]
+        d = zscore_cols(d[start:start + half])
+
+    # float32 halves memory traffic and lets BLAS use sgemm for the projection
+    return d.astype(np.float32, copy=False)
 
-    return zscore(d, axis=0)
+# Writes an array to path via a temporary file, so a crashed worker never
+# leaves a truncated .npy behind
+def _atomic_save(path, arr):
+    tmp = path + '.tmp'
+    try:
+        with open(tmp, 'wb') as f:
+            np.save(f, arr, allow_pickle=False)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+# Saves several (path, array) pairs on two threads; the writes release the GIL,
+# so on slow storage one file's write overlaps the next
+def save_arrays(pairs):
+    with ThreadPoolExecutor(2) as tp:
+        futures = [tp.submit(_atomic_save, path, arr) for path, arr in pairs]
+        for f in futures:
+            f.result()
+
+# Per-worker arena for aligned timeseries. It grows to the largest request seen
+# and is reused by later tasks, which is safe because each task finishes saving
+# its output before returning. Sized on demand since T and V vary by parcel.
+_ALIGN_BUF = np.empty(0, dtype=np.float32)
+
+def _align_buffer(count, n_rows, n_cols):
+    global _ALIGN_BUF
+    size = count * n_rows * n_cols
+    if _ALIGN_BUF.size < size:
+        _ALIGN_BUF = np.empty(size, dtype=np.float32)
+    return _ALIGN_BUF[:size].reshape(count, n_rows, n_cols)
 
 # Ensure apply_mappers canonical definition exists
+# (proj is the mapper's projection matrix as contiguous float32, see mapper_proj)
 def apply_mappers(args):
-    data_out_fn, mapper_out_fn, subject, mapper, current_parcel, split = args
+    data_out_fn, mapper_out_fn, subject, proj, current_parcel, split = args
     try:
         dtseries = prep_dtseries((subject, current_parcel, split))
-        aligned = zscore((np.asmatrix(dtseries) * mapper._proj).A, axis=0)
-        np.save(data_out_fn, aligned)
-        np.save(mapper_out_fn, mapper._proj)
+        out = _align_buffer(1, dtseries.shape[0], proj.shape[1])[0]
+        aligned = zscore_inplace(np.matmul(dtseries, proj, out=out))
+        save_arrays([(data_out_fn, aligned), (mapper_out_fn, proj)])
         print("Successfully processed subject {} (split: {})".format(subject, split))
     except Exception as e:
         print("Error processing subject {} (split: {}): {}".format(subject, split, e))
 
 # NEW: Apply hyperalignment mappers from split-half analysis
 def apply_mappers_split(args):
-    data_out_fn, mapper_fn, subject, mapper0, mapper1, current_parcel = args
+    data_out_fn, mapper_fn, subject, proj0, proj1, current_parcel = args
     try:
-        dtseries0 = prep_dtseries((subject, current_parcel, 0))
-        dtseries1 = prep_dtseries((subject, current_parcel, 1))
-
-        aligned0 = zscore((np.asmatrix(dtseries0) * mapper0._proj).A, axis=0)
-        aligned1 = zscore((np.asmatrix(dtseries1) * mapper1._proj).A, axis=0)
+        # Read the CIFTI file once and take both halves from it
+        full = load_dtseries_data(subject, parcel=current_parcel)
+        half = full.shape[0] // 2
+
+        # Both halves as one (2, T/2, V) stack; select_split normalizes them in
+        # place, so the assignment is normally a no-op
+        halves = full[:2 * half].reshape(2, half, full.shape[1])
+        for split in (0, 1):
+            halves[split] = select_split(full, split)
+
+        # One batched sgemm for both halves instead of two separate calls
+        out = _align_buffer(2, half, proj0.shape[1])
+        aligned = np.matmul(halves, np.stack([proj0, proj1]), out=out)
+        aligned0 = zscore_inplace(aligned[0])
+        aligned1 = zscore_inplace(aligned[1])
+        del full, halves
 
         # Save aligned splits and mapper projections
-        np.save(data_out_fn + '_0.npy', aligned0)
-        np.save(data_out_fn + '_1.npy', aligned1)
-        np.save(mapper_fn + '_0.npy', mapper0._proj)
-        np.save(mapper_fn + '_1.npy', mapper1._proj)
+        save_arrays([(data_out_fn + '_0.npy', aligned0),
+                     (data_out_fn + '_1.npy', aligned1),
+                     (mapper_fn + '_0.npy', proj0),
+                     (mapper_fn + '_1.npy', proj1)])
 
         print("Successfully processed split data for subject {}".format(subject))
     except Exception as e:
@@ -193,46 +353,144 @@ def apply_mappers_split(args):
         return
     
 
-# runs the hyperalignment pipeline for the full timeseries data    
-def drive_hyperalignment_full(train_subjects, test_subjects, connectome_dir, mapper_dir, aligned_dir, current_parcel):
+# Projection matrix of a trained mapper as contiguous float32. Cast once in the
+# parent so workers receive half the bytes and matmul runs as sgemm directly.
+def mapper_proj(mapper):
+    return np.ascontiguousarray(mapper._proj, dtype=np.float32)
+
+
+# Runs func over args_list on the pool and returns the results in input order.
+# imap_unordered with a chunksize avoids one IPC round trip per item and lets
+# fast items complete without waiting on slow ones; results are put back in order
+# because Hyperalignment pairs datasets and mappers by position
+def _call_indexed(item):
+    i, func, args = item
+    return i, func(args)
+
+def ordered_imap(pool, func, args_list):
+    results = [None] * len(args_list)
+    chunksize = max(1, len(args_list) // (pool_num * 4))
+    tagged = [(i, func, args) for i, args in enumerate(args_list)]
+    for i, result in pool.imap_unordered(_call_indexed, tagged, chunksize=chunksize):
+        results[i] = result
+    return results
+
+
+# Prepared connectome datasets of this run, keyed by (subject, parcel, split)
+# with split None for full connectomes. In 'both' mode the split driver reuses
+# what the full driver loaded instead of reading and normalizing it again;
+# Hyperalignment only reads its input datasets, so sharing them is safe.
+_CNX_CACHE = {}
+
+# Background loads started by prefetch_connectomes, as (keys, AsyncResult)
+_CNX_PENDING = []
+
+# Keys of subjects whose connectomes are neither cached nor being prefetched,
+# with the loader and its task args
+def _cnx_tasks(subjects, connectome_dir, current_parcel, split):
+    pending = {key for keys, _ in _CNX_PENDING for key in keys}
+    missing = [(subject, current_parcel, split) for subject in subjects
+               if (subject, current_parcel, split) not in _CNX_CACHE
+               and (subject, current_parcel, split) not in pending]
+    if split is None:
+        args = [(subject, connectome_dir, current_parcel) for subject, _, _ in missing]
+        return missing, prep_cnx, args
+    args = [(subject, split, connectome_dir, current_parcel) for subject, _, _ in missing]
+    return missing, prep_cnx_split, args
+
+# Starts loading connectomes on the pool without waiting, so reading and
+# normalizing the test set overlaps hyperalignment training; load_connectomes
+# collects the results
+def prefetch_connectomes(pool, subjects, connectome_dir, current_parcel, split=None):
+    missing, func, args = _cnx_tasks(subjects, connectome_dir, current_parcel, split)
+    if missing:
+        chunksize = max(1, len(args) // (pool_num * 4))
+        _CNX_PENDING.append((missing, pool.map_async(func, args, chunksize=chunksize)))
+
+# Waits only for the prefetched sets that contain any of the needed keys, so a
+# failure in another set (e.g. a missing split file) stays with the driver that
+# needs it. A failed set is dropped and its keys are reloaded synchronously by
+# the caller, which then raises the actual error if it persists.
+def _collect_prefetched(needed):
+    for entry in list(_CNX_PENDING):
+        keys, result = entry
+        if needed.isdisjoint(keys):
+            continue
+        _CNX_PENDING.remove(entry)
+        try:
+            _CNX_CACHE.update(zip(keys, result.get()))
+        except Exception as e:
+            print("Prefetch failed, loading synchronously: {}".format(e))
+
+# Loads (or reuses) the connectome datasets of subjects for one parcel, in order
+def load_connectomes(pool, subjects, connectome_dir, current_parcel, split=None):
+    _collect_prefetched({(subject, current_parcel, split) for subject in subjects})
+    missing, func, args = _cnx_tasks(subjects, connectome_dir, current_parcel, split)
+    _CNX_CACHE.update(zip(missing, ordered_imap(pool, func, args)))
+    return [_CNX_CACHE[(subject, current_parcel, split)] for subject in subjects]
+
+# Whether precomputed split-half connectomes exist, judged by the first few
+# test subjects (one directory listing instead of a stat per file)
+def has_split_connectomes(connectome_dir, test_subjects, current_parcel):
+    with os.scandir(connectome_dir) as entries:
+        filenames = {e.name for e in entries}
+    return all('{a}_split_0_connectome_parcel_{i:03d}.npy'.format(a=subject, i=current_parcel) in filenames
+               for subject in test_subjects[:3])
+
+
+# Loads the training connectomes and trains the common model; returns None on
+# failure. Both drivers use the same training data, so in 'both' mode the
+# trained model is built once and passed to each of them. prefetch lists
+# (subjects, split) connectome sets to start loading while training runs.
+def train_hyperalignment(pool, train_subjects, connectome_dir, current_parcel, prefetch=()):
     t0 = time.time()
-    print("Starting hyperalignment for parcel {}".format(current_parcel))
-    print("Training subjects: {}".format(len(train_subjects)))
-    print("Test subjects: {}".format(len(test_subjects)))
-    
-    pool = mp.Pool(pool_num)
-    
     print("Loading training connectomes...")
     try:
-        # Prepare arguments with parcel info
         # Use full connectomes for training (matching Erica Bush's implementation)
-        train_args = [(subject, connectome_dir, current_parcel) for subject in train_subjects]
-        train_cnx = pool.map(prep_cnx, train_args)
+        train_cnx = load_connectomes(pool, train_subjects, connectome_dir, current_parcel)
         print("Successfully loaded {} training connectomes".format(len(train_cnx)))
     except Exception as e:
         print("Error loading training connectomes: {}".format(e))
-        pool.close()
-        return
+        return None
+
+    for subjects, split in prefetch:
+        prefetch_connectomes(pool, subjects, connectome_dir, current_parcel, split=split)
     
     print("Training hyperalignment...")
     ha = Hyperalignment(nproc=n_jobs, joblib_backend='multiprocessing')
     debug.active += ['HPAL']
     
     try:
-        ha(train_cnx)  # train the hyperalignment model
-        t1 = time.time() - t0
-        print('Finished training @ {:.2f} seconds'.format(t1))
+        ha.train(train_cnx)  # train the common space only; no training-set mappers needed
+        print('Finished training @ {:.2f} seconds'.format(time.time() - t0))
     except Exception as e:
         print("Error during hyperalignment training: {}".format(e))
-        pool.close()
-        return
+        return None
+    return ha
+
+
+# runs the hyperalignment pipeline for the full timeseries data    
+def drive_hyperalignment_full(train_subjects, test_subjects, connectome_dir, mapper_dir, aligned_dir, current_parcel, pool=None, ha=None):
+    t0 = time.time()
+    print("Starting hyperalignment for parcel {}".format(current_parcel))
+    print("Training subjects: {}".format(len(train_subjects)))
+    print("Test subjects: {}".format(len(test_subjects)))
+    
+    if pool is None:
+        pool = get_pool()
+
+    if ha is None:
+        ha = train_hyperalignment(pool, train_subjects, connectome_dir, current_parcel,
+                                  prefetch=[(test_subjects, None)])
+        if ha is None:
+            return
+    t1 = time.time() - t0
     
     print("Loading test connectomes and applying mappers...")
     try:
-        test_args = [(subject, connectome_dir, current_parcel) for subject in test_subjects]
         # Use full connectomes for test subjects (matching Erica Bush's implementation)
-        test_cnx = pool.map(prep_cnx, test_args)
-        mappers = ha(test_cnx)  # get mappers for test subjects
+        test_cnx = load_connectomes(pool, test_subjects, connectome_dir, current_parcel)
+        mappers = [mapper_proj(m) for m in ha(test_cnx)]  # get mappers for test subjects
         
         # Prepare file paths
         data_fns = [os.path.join(aligned_dir, '{}_aligned_dtseries.npy'.format(s)) for s in test_subjects]
@@ -241,76 +499,56 @@ def drive_hyperalignment_full(train_subjects, test_subjects, connectome_dir, map
         # Apply mappers (None for split parameter in full timeseries)
         apply_args = [(data_fns[i], mapper_fns[i], test_subjects[i], mappers[i], current_parcel, None) 
                      for i in range(len(test_subjects))]
-        pool.map(apply_mappers, apply_args)
+        ordered_imap(pool, apply_mappers, apply_args)
         
         t2 = time.time() - t1
         print('Finished aligning full timeseries @ {:.2f} seconds'.format(t2))
         
     except Exception as e:
         print("Error during mapper application: {}".format(e))
-    finally:
-        pool.close()
-        pool.join()
 
 # NEW: runs the hyperalignment pipeline for the reliability subjects where mappers are learned in split halves
-def drive_hyperalignment_split(train_subjects, test_subjects, connectome_dir, mapper_dir, aligned_dir, current_parcel):
+def drive_hyperalignment_split(train_subjects, test_subjects, connectome_dir, mapper_dir, aligned_dir, current_parcel, pool=None, ha=None):
     print("Starting split-half hyperalignment for parcel {}".format(current_parcel))
     print("Training subjects: {}".format(len(train_subjects)))
     print("Test subjects: {}".format(len(test_subjects)))
     
     t0 = time.time()
-    pool = mp.Pool(pool_num)
-    
-    print("Loading training connectomes...")
-    try:
-        # Use full connectomes for training (matching Erica Bush's implementation)
-        train_args = [(subject, connectome_dir, current_parcel) for subject in train_subjects]
-        train_cnx = pool.map(prep_cnx, train_args)
-        print("Successfully loaded {} training connectomes".format(len(train_cnx)))
-    except Exception as e:
-        print("Error loading training connectomes: {}".format(e))
-        pool.close()
-        return
-    
-    print("Training hyperalignment...")
-    ha = Hyperalignment(nproc=n_jobs, joblib_backend='multiprocessing')
-    debug.active += ['HPAL']
-    
+    if pool is None:
+        pool = get_pool()
+
+    # Check if split connectome files exist, if not use regular connectomes
     try:
-        ha(train_cnx)  # train the hyperalignment model
-        t1 = time.time() - t0
-        print('Finished training @ {:.2f} seconds'.format(t1))
-    except Exception as e:
-        print("Error during hyperalignment training: {}".format(e))
-        pool.close()
-        return
+        split_files_exist = has_split_connectomes(connectome_dir, test_subjects, current_parcel)
+    except OSError:
+        split_files_exist = False
+
+    if ha is None:
+        prefetch = [(test_subjects, 0), (test_subjects, 1)] if split_files_exist else [(test_subjects, None)]
+        ha = train_hyperalignment(pool, train_subjects, connectome_dir, current_parcel,
+                                  prefetch=prefetch)
+        if ha is None:
+            return
+    t1 = time.time() - t0
     
     print("Processing split-half data...")
     try:
-        # Prepare split connectomes for test subjects
-        test_args0 = [(subject, 0, connectome_dir, current_parcel) for subject in test_subjects]  # split 0
-        test_args1 = [(subject, 1, connectome_dir, current_parcel) for subject in test_subjects]  # split 1
-
-        # Check if split connectome files exist, if not use regular connectomes
-        # Debug: print the exact file paths being checked
-        for subject in test_subjects[:3]:
-            check_path = os.path.join(connectome_dir, '{a}_split_0_connectome_parcel_{i:03d}.npy'.format(a=subject, i=current_parcel))
-            print("Checking for split connectome file:", check_path, "Exists:", os.path.exists(check_path))
-        split_files_exist = all(os.path.exists(os.path.join(connectome_dir, '{a}_split_0_connectome_parcel_{i:03d}.npy'.format(a=subject, i=current_parcel)))
-                              for subject in test_subjects[:3])  # Check first few subjects
         if split_files_exist:
             print("Using pre-computed split connectomes...")
-            test_cnx0 = pool.map(prep_cnx_split, test_args0)
-            test_cnx1 = pool.map(prep_cnx_split, test_args1)
+            test_cnx0 = load_connectomes(pool, test_subjects, connectome_dir, current_parcel, split=0)
+            test_cnx1 = load_connectomes(pool, test_subjects, connectome_dir, current_parcel, split=1)
         else:
             print("Split connectomes not found, using full connectomes for split analysis...")
-            test_args_full = [(subject, connectome_dir, current_parcel) for subject in test_subjects]
-            test_cnx0 = pool.map(prep_cnx, test_args_full)
-            test_cnx1 = pool.map(prep_cnx, test_args_full)
-
-        # Get mappers for both splits
-        mappers0 = ha(test_cnx0)
-        mappers1 = ha(test_cnx1)
+            # Both splits use the same (cached) datasets; ha() only reads them
+            test_cnx0 = load_connectomes(pool, test_subjects, connectome_dir, current_parcel)
+            test_cnx1 = test_cnx0
+
+        # Get mappers for both splits (identical inputs give identical mappers)
+        mappers0 = [mapper_proj(m) for m in ha(test_cnx0)]
+        if test_cnx1 is test_cnx0:
+            mappers1 = mappers0
+        else:
+            mappers1 = [mapper_proj(m) for m in ha(test_cnx1)]
 
         # Prepare file paths for split data
         data_fns = [os.path.join(aligned_dir, '{}_aligned_dtseries_split'.format(s)) for s in test_subjects]
@@ -319,42 +557,40 @@ def drive_hyperalignment_split(train_subjects, test_subjects, connectome_dir, ma
         # Apply split mappers
         apply_args = [(data_fns[i], mapper_fns[i], test_subjects[i], mappers0[i], mappers1[i], current_parcel) 
                      for i in range(len(test_subjects))]
-        pool.map(apply_mappers_split, apply_args)
+        ordered_imap(pool, apply_mappers_split, apply_args)
 
         t2 = time.time() - t1
         print('Finished aligning split timeseries @ {:.2f} seconds'.format(t2))
 
     except Exception as e:
         print("Error during split mapper application: {}".format(e))
-    finally:
-        pool.close()
-        pool.join()
 
 
-# Load atlas once
-glasser_atlas = load_glasser_atlas()
+# Atlas and per-parcel vertex indices: the tables utils builds once at import,
+# so there is a single atlas load and vertex table per process
+glasser_atlas = utils.parcellation
+_PARCEL_VERTICES = utils.PARCEL_MASKS
 
-# ============================================================================
-# UTILITY FUNCTIONS
-# ============================================================================
+# One worker pool shared by every driver call in this process, created on first
+# use so the workers (and their numpy/scipy/mvpa2 imports) are only paid for once
+_POOL = None
 
+def get_pool():
+    global _POOL
+    if _POOL is None:
+        _POOL = mp.Pool(pool_num)
+    return _POOL
 
-def discover_subject_ids():
-    """
-    Discover available subject IDs from dtseries files.
+def close_pool():
+    global _POOL
+    if _POOL is not None:
+        _POOL.close()
+        _POOL.join()
+        _POOL = None
 
-    Returns
-    -------
-    list of str
-        Sorted list of unique subject IDs
-    """
-    pattern = DTSERIES_PATTERN
-    ids = []
-    for fp in glob.glob(pattern):
-        name = os.path.basename(fp)
-        sid = name.split("_task-rest")[0]
-        ids.append(sid)
-    return sorted(set(ids))
+# ============================================================================
+# UTILITY FUNCTIONS
+# ============================================================================
 
 
 def format_subject_id(subject_id_raw):
@@ -383,6 +619,24 @@ def format_subject_id(subject_id_raw):
     return subject_id
 
 
+def format_subject_ids(subject_ids_raw):
+    """
+    Vectorized format_subject_id over a pandas Series of raw subject IDs.
+
+    Parameters
+    ----------
+    subject_ids_raw : pandas.Series
+        Raw subject IDs from CSV (may contain ',assessment')
+
+    Returns
+    -------
+    list of str
+        Formatted subject IDs, in the same order as the input
+    """
+    subject_ids = subject_ids_raw.astype(str).str.split(',').str[0].str.strip()
+    return subject_ids.where(subject_ids.str.startswith('sub-'), 'sub-' + subject_ids).tolist()
+
+
 def get_train_test_subjects(csv_path=None):
     """
     Get training and test subjects from freesurfer CSV file.
@@ -440,14 +694,11 @@ def get_train_test_subjects(csv_path=None):
         if use_metadata and metadata_path and os.path.exists(metadata_path):
             print("Using train/test split from metadata file: {}".format(metadata_path))
             try:
-                import pandas as pd
                 from read_config import SUBJECT_ID_COL, SPLIT_COL
 
-                # Load metadata file
-                if metadata_path.endswith('.csv'):
-                    df = pd.read_csv(metadata_path)
-                else:
-                    df = pd.read_excel(metadata_path)
+                # Load metadata file (only the ID and split columns are used;
+                # a missing split column is skipped rather than raising here)
+                df = utils.read_metadata_cached(metadata_path, [SUBJECT_ID_COL, SPLIT_COL])
 
                 print("Loaded {} subjects from metadata".format(len(df)))
 
@@ -460,14 +711,12 @@ def get_train_test_subjects(csv_path=None):
                     test_df = df[df[SPLIT_COL].str.lower() == 'test']
 
                     # Format subject IDs
-                    def format_id(sid):
-                        sid = str(sid).strip()
-                        if not sid.startswith('sub-'):
-                            sid = 'sub-' + sid
-                        return sid
+                    def format_ids(sids):
+                        sids = sids.astype(str).str.strip()
+                        return sids.where(sids.str.startswith('sub-'), 'sub-' + sids).tolist()
 
-                    train_subjects = [format_id(s) for s in train_df[SUBJECT_ID_COL].values]
-                    test_subjects = [format_id(s) for s in test_df[SUBJECT_ID_COL].values]
+                    train_subjects = format_ids(train_df[SUBJECT_ID_COL])
+                    test_subjects = format_ids(test_df[SUBJECT_ID_COL])
 
                     print("From metadata split column:")
                     print("  Training: {} subjects".format(len(train_subjects)))
@@ -481,8 +730,8 @@ def get_train_test_subjects(csv_path=None):
 
         # Fall back to random split
         print("Using random split of discovered subjects (respects metadata filtering)")
-        # Use utils._discover_subject_ids() which respects metadata filtering
-        all_subjects = utils._discover_subject_ids()
+        # Use utils.get_all_discovered() which respects metadata filtering
+        all_subjects = utils.get_all_discovered()
         print("Found {} total subjects".format(len(all_subjects)))
 
         random.seed(42)
@@ -527,8 +776,8 @@ def get_train_test_subjects(csv_path=None):
     print("  Test (other diagnoses): {}".format(len(test_df)))
 
     # Format subject IDs (remove ',assessment' and add 'sub-' prefix)
-    train_subjects = [format_subject_id(raw_id) for raw_id in train_df['subject_id'].values]
-    test_subjects = [format_subject_id(raw_id) for raw_id in test_df['subject_id'].values]
+    train_subjects = format_subject_ids(train_df['subject_id'])
+    test_subjects = format_subject_ids(test_df['subject_id'])
 
     # Show sample formatting
     if len(train_subjects) > 0:
@@ -539,12 +788,13 @@ def get_train_test_subjects(csv_path=None):
             print("  {} -> {}".format(raw, formatted))
 
     # Get available subjects from filesystem (respects metadata filtering)
-    available_subjects = utils._discover_subject_ids()
+    available_subjects = utils.get_all_discovered()
     print("\nAvailable in filesystem: {}".format(len(available_subjects)))
 
     # Filter to subjects with available data
-    train_subjects_available = [s for s in train_subjects if s in available_subjects]
-    test_subjects_available = [s for s in test_subjects if s in available_subjects]
+    available = set(available_subjects)
+    train_subjects_available = [s for s in train_subjects if s in available]
+    test_subjects_available = [s for s in test_subjects if s in available]
 
     print("\nFiltered to available data:")
     print("  Training: {}".format(len(train_subjects_available)))
@@ -623,12 +873,19 @@ if __name__ == '__main__':
         pattern = os.path.join(train_connectome_dir, '*_split_0_connectome_parcel_{:03d}.npy'.format(parcel))
         split_str = '_split_0_connectome'
 
-    available_files = glob.glob(pattern)
-    available_subjects = [os.path.basename(f).split(split_str)[0]
-                         for f in available_files]
+    file_re = re.compile(r'(.+?)' + re.escape('{}_parcel_{:03d}.npy'.format(split_str, parcel)) + '$')
+    available_files = []
+    available_subjects = []
+    with os.scandir(train_connectome_dir) as entries:
+        for e in entries:
+            m = file_re.match(e.name)
+            if m:
+                available_files.append(e.path)
+                available_subjects.append(m.group(1))
 
-    train_subjects = [s for s in train_subjects if s in available_subjects]
-    test_subjects = [s for s in test_subjects if s in available_subjects]
+    available = set(available_subjects)
+    train_subjects = [s for s in train_subjects if s in available]
+    test_subjects = [s for s in test_subjects if s in available]
 
     print("\nFiltered to subjects with available data:")
     print("  Training: {}".format(len(train_subjects)))
@@ -643,22 +900,38 @@ if __name__ == '__main__':
         sys.exit(1)
 
     print("  Training subjects: {}".format(train_subjects))
-    # Create output directories
+    # Create output directories (exist_ok: parallel parcel jobs share the parents)
     for dn in [aligned_dir, mapper_dir]:
-        if not os.path.isdir(dn):
-            os.makedirs(dn)
-            print("Created directory: {}".format(dn))
+        os.makedirs(dn, exist_ok=True)
     
-    # Run hyperalignment based on mode
-    if mode == 'full' or mode == 'both':
-        drive_hyperalignment_full(train_subjects, test_subjects,
-                                 train_connectome_dir, mapper_dir,
-                                 aligned_dir, parcel)
-
-    if mode == 'split' or mode == 'both':
-        drive_hyperalignment_split(train_subjects, test_subjects,
-                                  train_connectome_dir, mapper_dir,
-                                  aligned_dir, parcel)
+    # One worker pool for training and both drivers; always shut down, even if
+    # a phase raises
+    pool = get_pool()
+    try:
+        # In 'both' mode train the common model once and share it between drivers
+        # and load the test connectomes for both while it trains
+        ha = None
+        if mode == 'both':
+            prefetch = [(test_subjects, None)]
+            if has_split_connectomes(train_connectome_dir, test_subjects, parcel):
+                prefetch += [(test_subjects, 0), (test_subjects, 1)]
+            ha = train_hyperalignment(pool, train_subjects,
+                                      train_connectome_dir, parcel, prefetch=prefetch)
+            if ha is None:
+                print("Skipping alignment: hyperalignment training failed")
+
+        # Run hyperalignment based on mode
+        if mode == 'full' or (mode == 'both' and ha is not None):
+            drive_hyperalignment_full(train_subjects, test_subjects,
+                                     train_connectome_dir, mapper_dir,
+                                     aligned_dir, parcel, pool=pool, ha=ha)
+
+        if mode == 'split' or (mode == 'both' and ha is not None):
+            drive_hyperalignment_split(train_subjects, test_subjects,
+                                      train_connectome_dir, mapper_dir,
+                                      aligned_dir, parcel, pool=pool, ha=ha)
+    finally:
+        close_pool()
 
     total_time = time.time() - t_overall
     print("\n" + "="*80)
@@ -1,8 +1,11 @@
 import os
+import re
 import glob
+import fnmatch
+import hashlib
+import functools
 import numpy as np
 import nibabel as nib
-from scipy.stats import zscore
 from scipy.spatial.distance import cdist
 
 # Import centralized configuration
@@ -12,32 +15,61 @@ from read_config import (
     PARCELLATION_FILE, DTSERIES_FILENAME_TEMPLATE, DTSERIES_FILENAME_PATTERN,
     LOGDIR, METADATA_EXCEL, SUBJECT_ID_COL
 )
+# Metadata reads share the per-user parquet cache with organize_subjects
+from metadata_cache import read_metadata_cached
 
 # Legacy variables for backwards compatibility
 project_dir = "."
 scratch_dir = os.path.join(project_dir, TEMPORARY_OUTDIR)
 parcellation_dir = os.path.join(project_dir, "HCP_S1200_Atlas_Z4_pkXDZ")
 
+def _zscore(a):
+    """
+    Column-wise z-score like scipy's zscore(a, axis=0), computed in float32.
+    Works in place when a is already a writeable float32 array, otherwise on a
+    float32 copy; zero-variance columns become NaN as with scipy.
+    """
+    a = np.require(a, dtype=np.float32, requirements=['C', 'W'])
+    a -= a.mean(axis=0, keepdims=True)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        a /= a.std(axis=0, keepdims=True)
+    return a
+
+@functools.lru_cache(maxsize=1)
+def _load_cortex_dtseries(subj_id):
+    """
+    Cortical (T x VERTICES_IN_BOUNDS) float32 timeseries of a subject. The most
+    recent subject is cached, so building its full and split connectomes in the
+    same process reads the CIFTI file once; read-only because callers share it.
+    """
+    # Build filename using the configurable template and GSR tag
+    filename = DTSERIES_FILENAME_TEMPLATE.format(subj=subj_id)
+
+    # Slice the proxy so only the cortical columns are read and scaled, as float32
+    dataobj = nib.load(os.path.join(DTSERIES_ROOT, filename)).dataobj
+    ds = np.asarray(dataobj[:, :VERTICES_IN_BOUNDS], dtype=np.float32)
+    ds.setflags(write=False)
+    return ds
+
 def subj_dtseries_to_npy(subj_id, z=False, parcel=None):
     """
     load the dense timeseries return either the timeseries for specific parcels or the whole brain, in numpy format
-    can normalize or not
+    can normalize or not: columns are z-scored only when z is True, for parcels and whole brain alike
+    the whole-brain result without z is the shared cached array, so it is read-only
     """
 
-    # Build filename using the configurable template and GSR tag
-    filename = DTSERIES_FILENAME_TEMPLATE.format(subj=subj_id)
-    
-    ds = nib.load(os.path.join(DTSERIES_ROOT, filename)).get_fdata()[:,:VERTICES_IN_BOUNDS]
+    ds = _load_cortex_dtseries(subj_id)
 
     if parcel:
-        if type(parcel) == list:
-            to_return=[]
-            for p in parcel: 
-                mask=(parcellation==p).squeeze()
-            if z: return zscore(ds[:,mask],axis=0)
-            return ds[:,mask]        
-        
-    return zscore(ds[:,:VERTICES_IN_BOUNDS],axis=0)
+        # Vertex indices come from the precomputed PARCEL_MASKS table; a list of
+        # parcels selects the union of their vertices, in the order given
+        if isinstance(parcel, list):
+            idx = np.concatenate([PARCEL_MASKS[p] for p in parcel])
+        else:
+            idx = PARCEL_MASKS[parcel]
+        ds = ds[:, idx]
+
+    return _zscore(ds) if z else ds
 
 def subj_ptseries_to_npy(subj_id, fdata=True):
     # Look for ptseries files based on GSR setting
@@ -51,8 +83,8 @@ def subj_ptseries_to_npy(subj_id, fdata=True):
     
     ds = nib.load(ptseries_files[0])
     if fdata:
-        ds = zscore(ds.get_fdata(),axis=0)
-        ds = ds[:,:360]
+        # Only the 360 cortical parcels are kept, so read and normalize just those
+        ds = _zscore(np.asarray(ds.dataobj[:, :360], dtype=np.float32))
     return ds
 
 def get_glasser_atlas_file():
@@ -69,19 +101,63 @@ def get_glasser_atlas_file():
                 "The file should be a *.dlabel.nii atlas file.".format(PARCELLATION_FILE)
             )
         f = cands[0]
-    g = nib.load(f)
-    return g.get_fdata().T
+    return load_atlas_labels(f)
+
+def load_atlas_labels(path):
+    """
+    Load the labels of a CIFTI dlabel file as a read-only int16 array.
+
+    Labels are small integers, so int16 is exact and 4x smaller than float64.
+    The converted array is cached as .npy in scratch_dir, keyed by the atlas
+    path and mtime, and memory-mapped on later loads so processes share the
+    pages instead of each decoding the CIFTI file.
+    """
+    path = os.path.abspath(path)
+    key = "{}:{}".format(path, os.stat(path).st_mtime_ns)
+    cache = os.path.join(scratch_dir, "glasser_labels_{}.int16.npy".format(
+        hashlib.md5(key.encode("utf-8")).hexdigest()[:16]))
+
+    if os.path.exists(cache):
+        try:
+            return np.load(cache, mmap_mode='r')
+        except Exception as e:
+            print(f"Warning: Could not read atlas cache {cache}: {e}")
+
+    labels = np.asarray(nib.load(path).dataobj).T.astype(np.int16)
+
+    tmp = "{}.{}.tmp".format(cache, os.getpid())
+    try:
+        os.makedirs(scratch_dir, exist_ok=True)
+        with open(tmp, 'wb') as fh:
+            np.save(fh, labels)
+        os.replace(tmp, cache)
+    except OSError as e:
+        print(f"Warning: Could not write atlas cache {cache}: {e}")
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+    labels.setflags(write=False)
+    return labels
 
 
 # Load once at import so subj_dtseries_to_npy can mask parcels
 parcellation = get_glasser_atlas_file()
 
+# Vertex indices of each parcel, computed once instead of comparing the whole
+# atlas against a parcel id on every call
+_labels = parcellation.ravel()
+PARCEL_MASKS = {int(p): np.flatnonzero(_labels == p).astype(np.int32)
+                for p in np.unique(_labels) if p != 0}
+del _labels
+
 
+@functools.lru_cache(maxsize=1)
 def load_metadata_subjects():
     """
     Load subject IDs from METADATA_EXCEL file (supports both CSV and Excel).
     Returns all subjects in the file (regardless of train/test split).
     Set USE_METADATA_FILTER=1 environment variable to enable filtering.
+    The result is cached for the process; treat the returned list as read-only.
     """
     use_filter = os.environ.get('USE_METADATA_FILTER', '0') == '1'
 
@@ -93,17 +169,12 @@ def load_metadata_subjects():
         return None
 
     try:
-        import pandas as pd
-
-        # Auto-detect file format based on extension
-        if METADATA_EXCEL.endswith('.csv'):
-            df = pd.read_csv(METADATA_EXCEL)
-        else:
-            df = pd.read_excel(METADATA_EXCEL)
+        # Auto-detect file format based on extension; only the ID column is needed
+        df = read_metadata_cached(METADATA_EXCEL, [SUBJECT_ID_COL])
 
         # Normalize subject IDs to sub-XXXXX format
         subjects = df[SUBJECT_ID_COL].astype(str).str.strip()
-        subjects = subjects.apply(lambda x: x if x.startswith("sub-") else f"sub-{x}")
+        subjects = subjects.where(subjects.str.startswith("sub-"), "sub-" + subjects)
 
         print(f"Loaded {len(subjects)} subjects from metadata file")
         return sorted(set(subjects.tolist()))
@@ -113,28 +184,40 @@ def load_metadata_subjects():
 
 def _discover_subject_ids():
     """Find IDs with files like <ID>_task-rest_run-1__s5.dtseries.nii or <ID>_task-rest_run-1_nogsr_Atlas_s5.dtseries.nii"""
-    # Use the configurable discovery glob pattern defined at the top of the file
-    pattern = os.path.join(DTSERIES_ROOT, DTSERIES_FILENAME_PATTERN)
-
-    ids = []
-    for fp in glob.glob(pattern):
-        name = os.path.basename(fp)
-        sid = name.split("_task-rest")[0]
-        ids.append(sid)
+    # Scanned once per process; callers get their own copy of the cached IDs
+    return list(_discover_subject_ids_cached())
+
+@functools.lru_cache(maxsize=1)
+def _discover_subject_ids_cached():
+    # Match the configurable discovery pattern against one directory listing
+    # instead of glob stat'ing every candidate; a missing root means no subjects.
+    # Like glob, a leading '*' does not match hidden (dot) files
+    file_re = re.compile(fnmatch.translate(DTSERIES_FILENAME_PATTERN))
+    try:
+        with os.scandir(DTSERIES_ROOT) as entries:
+            ids = {e.name.split("_task-rest")[0] for e in entries
+                   if not e.name.startswith('.') and file_re.match(e.name)}
+    except FileNotFoundError:
+        ids = set()
 
-    discovered_ids = sorted(set(ids))
+    discovered_ids = sorted(ids)
 
     # Apply metadata filtering if enabled
     metadata_subjects = load_metadata_subjects()
     if metadata_subjects is not None:
-        filtered_ids = [sid for sid in discovered_ids if sid in metadata_subjects]
+        metadata_set = set(metadata_subjects)
+        filtered_ids = [sid for sid in discovered_ids if sid in metadata_set]
         print(f"Filtered: {len(discovered_ids)} discovered -> {len(filtered_ids)} in metadata")
-        return filtered_ids
+        return tuple(filtered_ids)
+
+    return tuple(discovered_ids)
 
-    return discovered_ids
+def get_all_discovered():
+    """All discovered (and metadata-filtered) subject IDs, from the single cached scan."""
+    return _discover_subject_ids()
 
 def get_HA_train_subjects():
-    ids = _discover_subject_ids()
+    ids = get_all_discovered()
     if len(ids) > 50:
         return ids[:50]
     return ids[: max(1, len(ids) // 2)]
@@ -144,7 +227,7 @@ def load_twin_subjects():
     return []
 
 def get_reliability_subjects():
-    ids = _discover_subject_ids()
+    ids = get_all_discovered()
     twins = set(load_twin_subjects())
     rest = [s for s in ids if s not in twins]
     return rest[:50] if len(rest) > 50 else rest